@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DynamicGate:
+    """
+    Limits the number of concurrent tasks like a semaphore, but with a limit that can be changed at any time.
+
+    The limit adapts to rate limiting: it is halved each time a request is throttled and grows back
+    by one after `recover_after` successful requests, up to its initial value.
+
+    Args:
+        limit (int): Maximum number of concurrent tasks.
+        min_limit (int, optional): Lowest limit reached by throttling. Defaults to 1.
+        recover_after (int, optional): Number of successful requests before raising the limit by one. Defaults to 20.
+
+    Attributes:
+        limit (int): Current maximum number of concurrent tasks.
+        max_limit (int): Initial limit, never exceeded by recovery.
+
+    Methods:
+        async set_limit(limit: int): Changes the limit, waking up waiting tasks if it was raised.
+        async throttled(): Halves the limit after a rate limited request.
+        async succeeded(): Counts a successful request, raising the limit after recover_after of them.
+    """
+
+    def __init__(self, limit: int, min_limit: int = 1, recover_after: int = 20):
+        self.limit = limit
+        self.max_limit = limit
+        self.min_limit = min_limit
+        self.recover_after = recover_after
+        self._active = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self._active -= 1
+            self._condition.notify(1)
+
+    async def set_limit(self, limit: int) -> None:
+        """Changes the limit, tasks already running are not interrupted when it is lowered."""
+        async with self._condition:
+            self.limit = max(self.min_limit, limit)
+            self._condition.notify_all()
+
+    async def throttled(self) -> None:
+        """Halves the limit after a rate limited request."""
+        self._successes = 0
+        if self.limit > self.min_limit:
+            await self.set_limit(self.limit // 2)
+            logger.debug(f"Rate limited, concurrency lowered to {self.limit}")
+
+    async def succeeded(self) -> None:
+        """Counts a successful request, raising the limit by one after recover_after of them."""
+        if self.limit >= self.max_limit:
+            return
+        self._successes += 1
+        if self._successes >= self.recover_after:
+            self._successes = 0
+            await self.set_limit(self.limit + 1)
+            logger.debug(f"Concurrency raised back to {self.limit}")
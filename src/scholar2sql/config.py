@@ -3,25 +3,27 @@ from pathlib import Path
 import os
 from pydantic import BaseModel, ConfigDict, SecretStr, computed_field, model_validator
 from pydantic_settings import BaseSettings, YamlConfigSettingsSource, PydanticBaseSettingsSource
-from typing import Literal, Optional, Type, Tuple
+from typing import TYPE_CHECKING, Literal, Optional, Type, Tuple
 from .scholar import Scholar
 from .sql import SqlAPIWrapper
 from .metadata import Metadata
 from .schema import SchemaInputParameter
 import json
+import hashlib
 import itertools
 import asyncio
 import logging
 from functools import cached_property
 from .llm import ScientificPaperPrompt, OpenAiAPIWrapper
 from typing_extensions import Self
-from scholaretl.article import Article
 
-from rich.logging import RichHandler
-from rich.console import Console
-from rich.theme import Theme
+if TYPE_CHECKING:
+    from scholaretl.article import Article
 
-console = Console(theme=Theme({"logging.level.custom": "green"}))
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as YamlLoader
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +40,12 @@ class ConfigsLogging(BaseModel):
     @model_validator(mode="after")
     def set_logging_levels(self):
         """Set the logging levels for the application and external packages."""
+        # Imported here as rich is only needed once logging is configured
+        from rich.logging import RichHandler
+        from rich.console import Console
+        from rich.theme import Theme
+
+        console = Console(theme=Theme({"logging.level.custom": "green"}))
         logging.getLogger().setLevel(self.external_packages.upper())
         logging.getLogger("scholar2sql").setLevel(self.level.upper())
         logging.basicConfig(
@@ -49,6 +57,8 @@ class ConfigsLogging(BaseModel):
 class DataProcessing(BaseModel):
     """Processing Config"""
     overwrite_existing: bool = False
+    num_workers: int = 32
+    sql_batch_size: int = 50
 
 class Configs(BaseSettings):
     """All configurations for the application."""
@@ -62,11 +72,37 @@ class Configs(BaseSettings):
 
     overwrite: bool = False
 
+    _pending_records: list = []
+    _added_count: int = 0
+
     @classmethod
     def from_yaml(cls, path: Path):
-        """Load configurations from a YAML file."""
-        with open(path, 'r') as yaml_file:
-            dx = yaml.safe_load(yaml_file) or {}
+        """Load configurations from a YAML file, reusing its JSON cache if it is up to date."""
+        path = Path(path)
+        cache_path = path.with_suffix(path.suffix + ".json")
+        content = path.read_bytes()
+        source_hash = hashlib.sha256(content).hexdigest()
+
+        try:
+            cache = json.loads(cache_path.read_bytes())
+        except (OSError, ValueError):
+            cache = {}
+        if isinstance(cache, dict) and cache.get("source_hash") == source_hash:
+            logger.debug(f"Loading configurations from cache {cache_path}")
+            dx = cache["config"]
+        else:
+            dx = yaml.load(content, Loader=YamlLoader) or {}
+            try:
+                # The cache holds the same secrets as the YAML file, give it the same permissions
+                mode = path.stat().st_mode & 0o777
+                fd = os.open(cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+                with os.fdopen(fd, "w") as cache_file:
+                    # The mode given to os.open only applies to a new file, set it before writing the secrets
+                    # (os.chmod rather than os.fchmod, which is missing on Windows before Python 3.13)
+                    os.chmod(cache_path, mode)
+                    json.dump({"source_hash": source_hash, "config": dx}, cache_file)
+            except (OSError, TypeError) as e:
+                logger.debug(f"Could not cache configurations to {cache_path}: {e}")
         return cls(**dx)
 
     @model_validator(mode='after')
@@ -77,7 +113,7 @@ class Configs(BaseSettings):
         self.sql_database._output_features = self.prompt.output_features
         return self
 
-    async def extract_and_fill_sql(self, research_question: str, article: Article, inputs_values: tuple[SchemaInputParameter], metadata: Metadata) -> bool:
+    async def extract_and_fill_sql(self, research_question: str, article: "Article", inputs_values: tuple[SchemaInputParameter], metadata: Metadata) -> bool:
         """
         Extract and fill SQL records for a given article and question.
 
@@ -88,31 +124,108 @@ class Configs(BaseSettings):
             metadata (Metadata): The metadata for the article.
 
         Returns:
-            bool: True if the record was successfully inserted or updated in the SQL database, False otherwise.
+            bool: True if the features were extracted and their record queued for the SQL database, False otherwise.
         """
-        coroutine_top_k_docs = asyncio.to_thread(self.scholar_search.get_top_sections, article=article, research_question=research_question)
         coroutine_record_id = self.sql_database.find_record(inputs_values=inputs_values, pubmed_id=metadata.pubmed_id.value)
 
-        sections, record_id = await asyncio.gather(coroutine_top_k_docs, coroutine_record_id)
+        if len(article.abstract) + len(article.section_paragraphs) <= self.scholar_search.top_sections_per_article:
+            # Every section is kept, there is no ranking to run in a thread
+            sections = self.scholar_search.get_top_sections(article=article, research_question=research_question)
+            record_id = await coroutine_record_id
+        else:
+            coroutine_top_k_docs = asyncio.to_thread(self.scholar_search.get_top_sections, article=article, research_question=research_question)
+            sections, record_id = await asyncio.gather(coroutine_top_k_docs, coroutine_record_id)
 
         metadata.sections.value = sections
 
         if self.data_processing.overwrite_existing or record_id is None:
             outputs = await self.openai.invoke_llm(research_question=research_question, sections=sections, pubmed_id=metadata.pubmed_id.value)
             if outputs is not None:  # In case of parsing error
-                await self.sql_database.upsert_record(record_id=record_id, inputs_values=inputs_values, metadata=metadata, outputs=outputs)
+                await self._save_record(record_id=record_id, inputs_values=inputs_values, metadata=metadata, outputs=outputs)
                 return True
             return False
         logger.debug(f"Record already in SQL at id: {record_id} for pubmed_id {metadata.pubmed_id.value}")
         return False
 
+    async def _save_record(self, record_id: int | None, inputs_values: tuple[SchemaInputParameter], metadata: Metadata, outputs) -> None:
+        """Buffer a record, writing the buffered records to SQL once sql_batch_size of them are pending."""
+        self._pending_records.append((record_id, inputs_values, metadata, outputs))
+        if len(self._pending_records) >= self.data_processing.sql_batch_size:
+            await self._flush_records()
+
+    async def _flush_records(self) -> None:
+        """Write the buffered records to SQL in a single transaction, counting those actually written."""
+        # Swapped before awaiting, so that records buffered meanwhile go to the next batch
+        records, self._pending_records = self._pending_records, []
+        if records:
+            self._added_count += await self.sql_database.upsert_many(records)
+
+    async def _produce(self, queue: asyncio.Queue) -> None:
+        """Feed every (question, article) pair to the workers, then one stop sentinel per worker."""
+        cancelled = False
+        try:
+            for research_question, pubmed_query, inputs_values in self.prompt.iter():
+                async for article, metadata in self.scholar_search.iter(pubmed_query):
+                    await queue.put((research_question, article, inputs_values, metadata))
+        except asyncio.CancelledError:
+            # Cancelled along with the workers, there is no one left to stop (and the queue may stay full).
+            # A CancelledError of an article retrieval cancelled elsewhere still stops the workers.
+            task = asyncio.current_task()
+            cancelled = task.cancelling() > 0 if hasattr(task, "cancelling") else True  # Python >= 3.11
+            raise
+        finally:
+            if not cancelled:
+                for _ in range(self.data_processing.num_workers):
+                    await queue.put(None)
+
+    async def _consume(self, queue: asyncio.Queue) -> Tuple[int, int]:
+        """Process jobs from the queue until the stop sentinel, returning (processed, extracted) counts."""
+        processed_count, extracted_count = 0, 0
+        while (job := await queue.get()) is not None:
+            research_question, article, inputs_values, metadata = job
+            extracted = await self.extract_and_fill_sql(research_question=research_question, article=article, inputs_values=inputs_values, metadata=metadata)
+            processed_count += 1
+            extracted_count += extracted
+            logger.debug(f"Processed pubmed_id {metadata.pubmed_id.value} ({processed_count} processed, {extracted_count} extracted by this worker)")
+        return processed_count, extracted_count
+
     async def run(self):
         """Run the application and extract features from articles."""
+        loop = asyncio.get_running_loop()
+        previous_task_factory = loop.get_task_factory()
+        if hasattr(asyncio, "eager_task_factory"):  # Python >= 3.12
+            # Tasks that complete without blocking (e.g. cache hits) finish synchronously
+            loop.set_task_factory(asyncio.eager_task_factory)
+        try:
+            await self._run()
+        finally:
+            # The loop may be the caller's (e.g. Jupyter), leave it as it was
+            loop.set_task_factory(previous_task_factory)
+
+    async def _run(self):
+        """Extract features from articles, with the producer and worker tasks."""
+        if not await self.openai.check_valid_key():
+            return
         await self.sql_database.create_table()
-        tasks = []
-        for research_question, pubmed_query, inputs_values in self.prompt.iter():
-            async for article, metadata in self.scholar_search.iter(pubmed_query):
-                tasks.append(asyncio.ensure_future(self.extract_and_fill_sql(research_question=research_question, article=article, inputs_values=inputs_values, metadata=metadata)))
-        results = await asyncio.gather(*tasks)
-
-        logger.info(f"Finished extracting features of {len(tasks)} articles and adding {sum(results)} articles at a cost of {self.openai._total_cost}")
\ No newline at end of file
+        # Bounded queue: article retrieval is paused while all workers are busy
+        queue = asyncio.Queue(maxsize=self.data_processing.num_workers)
+        producer = asyncio.ensure_future(self._produce(queue))
+        workers = [asyncio.ensure_future(self._consume(queue)) for _ in range(self.data_processing.num_workers)]
+        try:
+            processed_count = 0
+            for worker in asyncio.as_completed(workers):
+                processed, _ = await worker
+                processed_count += processed
+            await producer
+        finally:
+            # When a task failed, stop the others before closing the clients and connections they use
+            tasks = [producer, *workers]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._flush_records()
+            await self.scholar_search.aclose()
+            await self.sql_database.close()
+
+        cost = f" at a cost of {self.openai._total_cost}" if self.openai.track_cost else ""
+        logger.info(f"Finished extracting features of {processed_count} articles and adding {self._added_count} articles{cost}")
@@ -2,6 +2,8 @@ from pydantic import BaseModel
 import json
 from typing import Dict, List, Any
 
+_BRACE_TABLE = str.maketrans({"{": "{{", "}": "}}"})
+
 class Example(BaseModel):
     """
     A class representing an example with inputs, sections, outputs, and mock data.
@@ -40,6 +42,6 @@ class Example(BaseModel):
     @staticmethod
     def _escape_braces(s: str) -> str:
         """
-        Escape curly braces in a string by doubling them.
+        Escape curly braces in a string by doubling them, in a single pass.
         """
-        return s.replace("{", "{{").replace("}", "}}")
\ No newline at end of file
+        return s.translate(_BRACE_TABLE)
\ No newline at end of file
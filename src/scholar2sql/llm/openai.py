@@ -1,16 +1,21 @@
 import asyncio
+import hashlib
+import json
 import logging
+import sqlite3
+from contextlib import closing, nullcontext
 from functools import cached_property
+from pathlib import Path
 
-from tenacity import retry, stop_after_attempt, retry_if_exception_type, wait_random
+from tenacity import retry, stop_after_attempt, retry_if_exception_type, wait_exponential_jitter
 from langchain.chains import LLMChain
 from langchain.callbacks.tracers import ConsoleCallbackHandler
 from langchain_community.callbacks import get_openai_callback, OpenAICallbackHandler
 from langchain_core.exceptions import OutputParserException
 from langchain_openai import ChatOpenAI
-from pydantic import BaseModel, SecretStr, computed_field
-from typing import List
-from openai import AuthenticationError
+from pydantic import BaseModel, SecretStr, computed_field, model_validator
+from typing import List, Optional
+from openai import AsyncOpenAI, AuthenticationError
 import httpx
 
 logger = logging.getLogger(__name__)
@@ -25,26 +30,46 @@ class OpenAiAPIWrapper(BaseModel):
         temperature (float, optional): The temperature to use for the OpenAI model. Defaults to 0.
         token (SecretStr): The OpenAI API key.
         verbose (bool, optional): Whether to enable verbose logging. Defaults to False.
+        concurrency (int, optional): Maximum number of concurrent API calls. Defaults to 5.
+        track_cost (bool, optional): Whether to monitor the openai expense with langchain's callback. Defaults to True.
+        tmp_cache_path (Path, optional): SQLite file caching the parsed LLM outputs by model, prompt, question and sections, None disables caching. Defaults to "tmp/llm_cache.db".
 
     Attributes:
         llm (ChatOpenAI): The initialized ChatOpenAI instance.
         _openai_semaphore (asyncio.Semaphore): Asynchronous semaphore to manage concurrent API calls.
         _chain (LLMChain, optional): The Langchain LLMChain to use for invoking the model.
         _total_cost (float): Monitor openai expense.
+        _valid_key (bool, optional): Outcome of the API key check, None until checked.
 
     Methods:
+        async check_valid_key() -> bool: Checks once that the API key is accepted by OpenAI.
         async invoke_llm(question: str, sections: dict, pubmed_id: str = None) -> dict | None: Asynchronously invokes the LLM with the given question and sections.  Returns the LLM's response or None if an error occurs.
     """
     model: str = "gpt-o-mini"
     temperature: float = 0.0
     token: SecretStr
     verbose: bool = False
+    concurrency: int = 5
+    track_cost: bool = True
+    tmp_cache_path: Optional[Path] = Path("tmp/llm_cache.db")
     
     _chain: LLMChain = None # Requires setting this before use
 
     _total_cost: float = 0
 
-    _openai_semaphore: asyncio.Semaphore = asyncio.Semaphore(5)
+    _openai_semaphore: asyncio.Semaphore = None
+
+    _valid_key: Optional[bool] = None
+    _valid_key_lock: asyncio.Lock = None
+
+    @model_validator(mode="after")
+    def val_model_after(self):
+        # Created per instance rather than shared through the class defaults
+        self._openai_semaphore = asyncio.Semaphore(self.concurrency)
+        self._valid_key_lock = asyncio.Lock()
+        if self.tmp_cache_path is not None:
+            self.tmp_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        return self
 
     @computed_field
     @cached_property
@@ -60,19 +85,54 @@ class OpenAiAPIWrapper(BaseModel):
             llm = llm.with_config({"callbacks": [ConsoleCallbackHandler()]})
         return llm
     
-    @computed_field
-    @cached_property
-    def valid_key(self) -> bool:
-        try:
-            response = self.llm.invoke("Hello, how are you?")
-            return True
-        except AuthenticationError:
-            logger.error(f"Your openai key is invalid")
-            return False
-            
+    async def check_valid_key(self) -> bool:
+        """
+        Checks that the API key is accepted by OpenAI, probing the API only once.
+
+        The probe lists the available models, which is not billed and bypasses the LLM cache.
+
+        Returns:
+            bool: True if the key is valid, False otherwise.
+        """
+        async with self._valid_key_lock:
+            if self._valid_key is None:
+                try:
+                    async with AsyncOpenAI(api_key=self.token.get_secret_value()) as client:
+                        await client.models.list()
+                    self._valid_key = True
+                except AuthenticationError:
+                    logger.error(f"Your openai key is invalid")
+                    self._valid_key = False
+        return self._valid_key
+
+    def _cache_key(self, research_question: str, sections: dict) -> str:
+        """Hash of everything the LLM output depends on: the model, the prompt, the question and the sections."""
+        payload = json.dumps(
+            [self.model, self.temperature, self._chain.first.template, research_question, sections],
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _connect_cache(self) -> sqlite3.Connection:
+        """Open the LLM output cache, creating its table on first use."""
+        conn = sqlite3.connect(self.tmp_cache_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS llm_outputs (key TEXT PRIMARY KEY, output TEXT NOT NULL)")
+        return conn
+
+    def _load_output(self, key: str) -> Optional[str]:
+        """Load a cached output as JSON, None if it is not cached."""
+        with closing(self._connect_cache()) as conn:
+            row = conn.execute("SELECT output FROM llm_outputs WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _save_output(self, key: str, output: str) -> None:
+        """Cache an output successfully parsed, as JSON."""
+        with closing(self._connect_cache()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO llm_outputs (key, output) VALUES (?, ?)", (key, output))
+
     @retry(
-        stop=stop_after_attempt(5),
-        wait=wait_random(min=0.1, max=0.5),
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=0.1, max=30.0, jitter=0.5),
         retry_error_callback=lambda _: (_ for _ in ()).throw(httpx.ConnectError("Looks like Openai is down!"))
     )
     async def invoke_llm(self, research_question: str, sections: dict, pubmed_id: str = None) -> dict | None:
@@ -87,11 +147,17 @@ class OpenAiAPIWrapper(BaseModel):
         Returns:
             dict | None: The LLM's response, or None if an error occurs.
         """
-        if not self.valid_key:
-            return None
+        if self.tmp_cache_path is not None:
+            # Looked up before waiting for a slot, cached outputs don't call OpenAI
+            key = self._cache_key(research_question, sections)
+            output = await asyncio.to_thread(self._load_output, key)
+            if output is not None:
+                logger.debug(f"Found extracted features for {pubmed_id} in the LLM cache")
+                return self._chain.last.pydantic_object.model_validate_json(output)
 
         async with self._openai_semaphore:
-            with get_openai_callback() as cb:
+            # The callback installs global handlers on every call, only enter it when the cost is monitored
+            with get_openai_callback() if self.track_cost else nullcontext() as cb:
                 try:
                     result = await self._chain.ainvoke(
                         {
@@ -99,9 +165,14 @@ class OpenAiAPIWrapper(BaseModel):
                             "sections": sections,
                         }
                     )
-                    self._total_cost += cb.total_cost
-
-                    logger.debug(f"Successfully extracted features for {pubmed_id} at a cost of {cb.total_cost}")
+                    if cb is not None:
+                        self._total_cost += cb.total_cost
+                        logger.debug(f"Successfully extracted features for {pubmed_id} at a cost of {cb.total_cost}")
+                    else:
+                        logger.debug(f"Successfully extracted features for {pubmed_id}")
+                    if self.tmp_cache_path is not None:
+                        # Only parsed outputs are cached, a parsing error is retried on the next run
+                        await asyncio.to_thread(self._save_output, key, result.model_dump_json())
                     return result # Extract the actual result from the chain output.
                 
                 except OutputParserException as e:
@@ -1,18 +1,30 @@
 from pydantic import BaseModel, Field, computed_field, create_model, model_validator, ConfigDict
-from functools import cached_property
+from typing_extensions import Annotated
+from functools import cached_property, lru_cache
 import itertools
 from typing import Iterator, Optional, List, Tuple
 from langchain.output_parsers import PydanticOutputParser
-from langchain.prompts.few_shot import FewShotPromptTemplate
 from langchain.prompts.prompt import PromptTemplate
 
 from .example import Example
-from ..schema import SchemaInputParameter, SchemaOutputFeature
+from ..schema import SchemaInputParameter, SchemaItem, SchemaOutputFeature
 
 PROMPT_TEMPLATE = """Given the following extracted parts of a scientific paper. The goal is to generate a detailed summary in JSON format aiming {research_goal}.
 Only respond when there is strong evidence that the paper reports thorough answer.{information_to_exclude}
 For your reasoning and answering keep in mind that some sections may contain syntax errors (symbols, math equations, formulas, abbreviations, punctuation marks etc.)\n{format_instructions}"""
 
+EXAMPLE_TEMPLATE = "QUESTION: {research_question}\n{sections}\n{answer}"
+
+QUESTION_TEMPLATE = "QUESTION: {research_question}\n{sections}\n"
+
+@lru_cache(maxsize=None)
+def _format_question(research_question: str, parameter_names: Tuple[str, ...], items: Tuple[SchemaItem, ...]) -> str:
+    """Format the research question with input items, memoized on the (hashable) items."""
+    return research_question.format(**{
+        name: f"{item.name} (a.k.a {', '.join(item.llm_alias)})" if item.llm_alias else item.name
+        for name, item in zip(parameter_names, items)
+    })
+
 class ScientificPaperPrompt(BaseModel):
     """
     A class to generate and manage prompts for scientific paper analysis.
@@ -26,6 +38,8 @@ class ScientificPaperPrompt(BaseModel):
     output_features: List[SchemaOutputFeature]
     examples: List[Example] = []
 
+    _format_instructions: str = ""
+
     @model_validator(mode='after')
     def generate_example_mocks(self) -> 'ScientificPaperPrompt':
         """Generate mock examples for each example in the prompt."""
@@ -33,11 +47,18 @@ class ScientificPaperPrompt(BaseModel):
             example.get_mock(research_question=self.research_question, mapping=self.mapping)
         return self
 
+    @model_validator(mode='after')
+    def generate_format_instructions(self) -> 'ScientificPaperPrompt':
+        """Serialize the JSON schema instructions of the output mapping once."""
+        self._format_instructions = self.parser.get_format_instructions()
+        return self
+
     @staticmethod
-    def build_query(items: Tuple[SchemaInputParameter, ...]) -> str:
-        """Build a query string from a tuple of SchemaInput items."""
+    @lru_cache(maxsize=None)
+    def build_query(items: Tuple[SchemaItem, ...]) -> str:
+        """Build a query string from a tuple of SchemaItem items."""
         return " AND ".join(
-            f"({' OR '.join([item.name] + (item.pubmed_alias or []))})"
+            f"({' OR '.join((item.name, *(item.pubmed_alias or ())))})"
             for item in items
         )
 
@@ -45,15 +66,13 @@ class ScientificPaperPrompt(BaseModel):
     @cached_property
     def mapping(self) -> BaseModel:
         """Create dynamically a Pydantic model for the output mapping."""
-        model_fields = {}
-        for output in self.output_features:
+        def field_definition(output: SchemaOutputFeature) -> tuple:
             field_type = List[output.data_type] if output.multiple_values else output.data_type
-            field = Field(description=output.description)
-            if not output.required:
-                field_type = Optional[field_type]
-                field.default = None
-            model_fields[output.name] = (field_type, field)
+            if output.required:
+                return Annotated[field_type, Field(description=output.description)], ...
+            return Annotated[Optional[field_type], Field(description=output.description)], None
 
+        model_fields = {output.name: field_definition(output) for output in self.output_features}
         return create_model('Mapping', **model_fields, __config__=ConfigDict(use_enum_values=True))
 
     @computed_field
@@ -64,32 +83,31 @@ class ScientificPaperPrompt(BaseModel):
 
     @computed_field
     @cached_property
-    def prompt(self) -> FewShotPromptTemplate:
-        """Create a FewShotPromptTemplate for the prompt."""
-        return FewShotPromptTemplate(
-            examples=[example.mock for example in self.examples],
-            example_prompt=PromptTemplate(
-                input_variables=["research_question", "sections", "answer"],
-                template="QUESTION: {research_question}\n{sections}\n{answer}"
-            ),
-            prefix=self.prompt_template,
-            suffix="QUESTION: {research_question}\n{sections}\n",
+    def static_prefix(self) -> str:
+        """Render the part of the prompt shared by every article (instructions and examples), with braces escaped."""
+        instructions = self.prompt_template.format(
+            research_goal=self.research_goal,
+            information_to_exclude=self.information_to_exclude,
+            format_instructions=self._format_instructions,
+        )
+        # Example mocks are already brace-escaped
+        examples = [EXAMPLE_TEMPLATE.format(**example.mock) for example in self.examples]
+        return "\n\n".join([Example._escape_braces(instructions), *examples])
+
+    @computed_field
+    @cached_property
+    def prompt(self) -> PromptTemplate:
+        """Create a PromptTemplate for the prompt, only the question and sections are formatted per article."""
+        return PromptTemplate(
+            template=f"{self.static_prefix}\n\n{QUESTION_TEMPLATE}",
             input_variables=["research_question", "sections"],
-            partial_variables={
-                "research_goal": self.research_goal,
-                "information_to_exclude": self.information_to_exclude,
-                "format_instructions": self.parser.get_format_instructions(),
-            },
         )
     
-    def format_question(self, items: Tuple[SchemaInputParameter, ...]) -> str:
+    def format_question(self, items: Tuple[SchemaItem, ...]) -> str:
         """Format the question with input items."""
-        return self.research_question.format(**{
-            self.input_parameters[i].name: f"{item.name} (a.k.a {', '.join(item.llm_alias)})" if item.llm_alias else item.name
-            for i, item in enumerate(items)
-        })
+        return _format_question(self.research_question, tuple(item.name for item in self.input_parameters), items)
 
-    def iter(self) -> Iterator[Tuple[str, str, Tuple[SchemaInputParameter, ...]]]:
+    def iter(self) -> Iterator[Tuple[str, str, Tuple[SchemaItem, ...]]]:
         """Iterate over all combinations of inputs, yielding formatted questions and queries."""
         for input_parameter_product in itertools.product(*[item.value for item in self.input_parameters]):
             yield (
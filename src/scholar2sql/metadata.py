@@ -1,5 +1,6 @@
 from pydantic import BaseModel, field_validator
-from typing import Dict, List, Literal
+from operator import attrgetter
+from typing import Callable, ClassVar, Dict, List, Literal
 from typing_extensions import Self
 from .schema import SchemaMetadata
 
@@ -33,6 +34,11 @@ class Metadata(BaseModel):
     )
     to_save: List[Literal["pubmed_id", "format", "sections"]] = ["pubmed_id", "format", "sections"]
 
+    # Built once per class so updates don't introspect the model fields
+    _FIELD_GETTERS: ClassVar[Dict[str, Callable]] = {
+        field: attrgetter(field) for field in ("pubmed_id", "format", "sections")
+    }
+
     def update_from_dict(self, data: Dict[str, any]) -> Self:
         """
         Updates metadata fields from a dictionary.
@@ -43,9 +49,10 @@ class Metadata(BaseModel):
         Returns:
             Self: Updated instance of the Metadata class.
         """
-        for field in self.model_fields:
-            if field in data and hasattr(self, field):
-                setattr(getattr(self, field), 'value', data[field])
+        for field, value in data.items():
+            getter = self._FIELD_GETTERS.get(field)
+            if getter is not None:
+                getter(self).value = value
         return self
 
     @field_validator("to_save", mode="before")
@@ -1,9 +1,10 @@
 from enum import Enum
-from typing import List, Dict, Union, Optional, Type
-from pydantic import BaseModel, computed_field, model_validator, field_validator
+from typing import List, Dict, Union, Optional, Tuple, Type
+from pydantic import BaseModel, ConfigDict, computed_field, model_validator, field_validator
 from pydantic.json_schema import GetJsonSchemaHandler
 from pydantic_core import core_schema
 import json
+from functools import cached_property
 
 class EnumSchemaDoc(Enum):
     """
@@ -30,10 +31,14 @@ class SchemaEnum(BaseModel):
 class SchemaItem(BaseModel):
     """
     Represents an item in the schema with name and optional aliases.
+
+    Items are immutable and hashable so they can be used as cache keys.
     """
     name: str
-    llm_alias: Optional[List[str]] = None
-    pubmed_alias: Optional[List[str]] = None
+    llm_alias: Optional[Tuple[str, ...]] = None
+    pubmed_alias: Optional[Tuple[str, ...]] = None
+
+    model_config = ConfigDict(frozen=True)
 
     @field_validator("pubmed_alias", "llm_alias", mode="before")
     def parse_aliases(cls, value: Optional[str]) -> Optional[List[str]]:
@@ -50,9 +55,9 @@ class SchemaMetadata(BaseModel):
     value: Optional[Union[str, List, Dict]] = None
 
     @computed_field
-    @property
+    @cached_property
     def sql_data_type(self) -> str:
-        """Infer SQL data_type based on the Python data_type and max_length."""
+        """Infer SQL data_type based on the Python data_type and max_length (computed once)."""
         if self.data_type in (list, dict) or getattr(self, 'multiple_values', False):
             return "JSON"
         if issubclass(self.data_type, EnumSchemaDoc) or self.data_type == str:
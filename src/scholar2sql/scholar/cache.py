@@ -0,0 +1,39 @@
+import pickle
+from pathlib import Path
+from scholaretl.article import Article
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_article(source_path: Path) -> Article | None:
+    """
+    Load the Article parsed from a source file (TEI, XML) from its pickle sibling.
+
+    Args:
+        source_path (Path): Path of the file the article was parsed from.
+
+    Returns:
+        Article | None: The cached Article, or None if missing or older than the source file.
+    """
+    cache_path = source_path.with_suffix(".pkl")
+    if not cache_path.exists() or cache_path.stat().st_mtime < source_path.stat().st_mtime:
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        logger.debug(f"Ignoring unreadable cached article {cache_path}: {e}")
+        return None
+
+
+def dump_article(source_path: Path, article: Article) -> None:
+    """
+    Save the Article parsed from a source file next to it, to skip parsing on the next run.
+
+    Args:
+        source_path (Path): Path of the file the article was parsed from.
+        article (Article): The parsed article.
+    """
+    with open(source_path.with_suffix(".pkl"), 'wb') as f:
+        pickle.dump(article, f, protocol=pickle.HIGHEST_PROTOCOL)
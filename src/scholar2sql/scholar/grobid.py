@@ -1,10 +1,12 @@
 import asyncio
+import time
 from pathlib import Path
 import httpx
-from tenacity import retry, stop_after_attempt, retry_if_exception_type, wait_random
+from tenacity import retry, stop_after_attempt, retry_if_exception_type, wait_exponential_jitter
 from pydantic import BaseModel, model_validator
 from scholaretl.article_parser import TEIXMLParser
 from scholaretl.article import Article
+from .cache import load_article, dump_article
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,6 +17,7 @@ RETRY_EXCEPTIONS = (
     httpx.ReadTimeout, 
     httpx.ConnectError, 
     httpx.ReadError,
+    httpx.PoolTimeout,
     ValueError
 )
 
@@ -30,6 +33,10 @@ class GrobidAPIWrapper(BaseModel):
         min_pdf_size (int): Minimum acceptable size for downloaded PDFs in bytes.
         tmp_pdf_folder (Path): Temporary folder to store downloaded PDFs.
         tmp_tei_folder (Path): Temporary folder to store parsed TEI XML files.
+        grobid_concurrency (int): Maximum number of PDFs sent to GROBID at once, match it to GROBID's nParallel.
+        download_concurrency (int): Maximum number of PDFs downloaded at once.
+        connection_ttl (float): Seconds during which the outcome of the GROBID connection check is reused.
+        client (httpx.AsyncClient): HTTP client shared by all GROBID and Unpaywall requests.
     """
 
     url: str = None
@@ -37,29 +44,59 @@ class GrobidAPIWrapper(BaseModel):
     min_pdf_size: int = 10000
     tmp_pdf_folder: Path = Path("tmp/pdf")
     tmp_tei_folder: Path = Path("tmp/tei")
+    grobid_concurrency: int = 10
+    download_concurrency: int = 100
+    connection_ttl: float = 60.0
 
-    _grobid_semaphore: asyncio.Semaphore = asyncio.Semaphore(1)
-    _pdf_semaphore: asyncio.Semaphore = asyncio.Semaphore(100)
+    _grobid_semaphore: asyncio.Semaphore = None
+    _pdf_semaphore: asyncio.Semaphore = None
+
+    _client: httpx.AsyncClient = None
+    _connected: bool = False
+    _connection_checked_at: float = None
 
     @model_validator(mode="after")
     def val_model_after(self):
         self.tmp_pdf_folder.mkdir(parents=True, exist_ok=True)
         self.tmp_tei_folder.mkdir(parents=True, exist_ok=True)
+        self._grobid_semaphore = asyncio.Semaphore(self.grobid_concurrency)
+        self._pdf_semaphore = asyncio.Semaphore(self.download_concurrency)
         return self
 
     @property
-    def is_connected(self):
-        try:
-            _ = httpx.get(f"{self.url}/api/version")
-            return True
-        except httpx.ConnectError:
-            logger.error(f"grobid with url: {self.url} can't be access.")
-        return False
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client reused across requests (and retries) to keep connections alive, created on first use."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0, connect=60.0),
+                # One connection per concurrent download and GROBID upload, plus the connection check
+                limits=httpx.Limits(max_connections=self.download_concurrency + self.grobid_concurrency + 1, max_keepalive_connections=20),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def is_connected(self) -> bool:
+        """Check that GROBID is reachable, reusing the last outcome for connection_ttl seconds."""
+        now = time.monotonic()
+        if self._connection_checked_at is None or now - self._connection_checked_at > self.connection_ttl:
+            try:
+                await self.client.get(f"{self.url}/api/version")
+                self._connected = True
+            except httpx.ConnectError:
+                logger.error(f"grobid with url: {self.url} can't be access.")
+                self._connected = False
+            self._connection_checked_at = now
+        return self._connected
 
     @retry(
         retry=retry_if_exception_type(RETRY_EXCEPTIONS),
-        stop=stop_after_attempt(5),
-        wait=wait_random(min=0.1, max=0.5),
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=0.1, max=30.0, jitter=0.5),
         retry_error_callback=lambda _: (_ for _ in ()).throw(httpx.ConnectError("Looks like Grobid is down!"))
     )
     async def parse_pdf_with_grobid(self, pubmed_id: str, pdf_path: Path) -> Article | None:
@@ -76,24 +113,25 @@ class GrobidAPIWrapper(BaseModel):
         tei_path = self.tmp_tei_folder / f"{pubmed_id}.tei"
 
         if tei_path.exists():
-            return self._load_existing_tei(tei_path)
+            logger.debug(f"Found TEI file for {pubmed_id} in tmp folder")
+            return await asyncio.to_thread(self._read_and_parse_tei, tei_path)
 
-        if not self.url or not pdf_path.exists() or not self.is_connected:
+        if not self.url or not pdf_path.exists() or not await self.is_connected():
             return None
 
         async with self._grobid_semaphore:
             tei_content = await self._send_pdf_to_grobid(pdf_path)
 
         if tei_content:
-            self._save_tei(tei_path, tei_content)
-            return self._parse_tei(tei_path)
+            # Disk writes and XML parsing run in a thread to keep the event loop responsive
+            return await asyncio.to_thread(self._save_and_parse_tei, tei_path, tei_content)
 
         return None
 
     @retry(
         retry=retry_if_exception_type(RETRY_EXCEPTIONS),
-        stop=stop_after_attempt(5),
-        wait=wait_random(min=0.1, max=0.5)
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=0.1, max=30.0, jitter=0.5)
     )
     async def download_and_parse_pdf(self, pubmed_id: str, doi: str) -> Article | None:
         """
@@ -112,12 +150,11 @@ class GrobidAPIWrapper(BaseModel):
             return await self.parse_pdf_with_grobid(pubmed_id, pdf_path)
 
         async with self._pdf_semaphore:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=60.0)) as client:
-                pdf_urls = self._get_pdf_urls_from_unpaywall(doi)
-                for pdf_url in pdf_urls:
-                    success = await self._download_pdf(client, pdf_url, pdf_path)
-                    if success:
-                        break
+            pdf_urls = await self._get_pdf_urls_from_unpaywall(doi)
+            for pdf_url in pdf_urls:
+                success = await self._download_pdf(pdf_url, pdf_path)
+                if success:
+                    break
 
         if pdf_path.exists() and pdf_path.stat().st_size > self.min_pdf_size:
             return await self.parse_pdf_with_grobid(pubmed_id, pdf_path)
@@ -126,22 +163,21 @@ class GrobidAPIWrapper(BaseModel):
 
     @retry(
         retry=retry_if_exception_type(RETRY_EXCEPTIONS),
-        stop=stop_after_attempt(5),
-        wait=wait_random(min=0.1, max=0.5),
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=0.1, max=30.0, jitter=0.5),
         retry_error_callback=lambda _: (_ for _ in ()).throw(httpx.ConnectError("Looks like unpaywall is down!"))
     )
-    def _get_pdf_urls_from_unpaywall(self, doi: str) -> str | None:
+    async def _get_pdf_urls_from_unpaywall(self, doi: str) -> list[str]:
         """
-        Get the PDF URL for a given DOI using the Unpaywall API.
+        Get the PDF URLs for a given DOI using the Unpaywall API.
 
         Args:
-            client (httpx.AsyncClient): Async HTTP client.
             doi (str): DOI of the article.
 
         Returns:
-            str | None: URL of the PDF if found, None otherwise.
+            list[str]: URLs of the open access PDFs found.
         """
-        response = httpx.get(
+        response = await self.client.get(
             f'https://api.unpaywall.org/v2/{doi}',
             params={'email': self.email},
             #verify=False  # TODO: Remove this in production
@@ -153,52 +189,69 @@ class GrobidAPIWrapper(BaseModel):
                 pdf_urls.append(value["url_for_pdf"])
         return pdf_urls
 
-    async def _send_pdf_to_grobid(self, pdf_path: Path) -> str | None:
+    async def _send_pdf_to_grobid(self, pdf_path: Path) -> bytes | None:
         """Send a PDF to GROBID for parsing."""
         with open(pdf_path, 'rb') as f:
-            pdf_content = f.read()
-
-        response = await httpx.AsyncClient().post(
-            f"{self.url}/api/processFulltextDocument",
-            files={"input": pdf_content},
-            headers={"Accept": "application/xml"},
-            timeout=httpx.Timeout(10.0, connect=60.0)
-        )
+            # Passing the file object lets httpx stream the upload
+            response = await self.client.post(
+                f"{self.url}/api/processFulltextDocument",
+                files={"input": f},
+                headers={"Accept": "application/xml"},
+            )
 
         if response.status_code == 429:
             raise httpx.ConnectTimeout("Error 429: Too Many Requests")
 
         response.raise_for_status()
-        return response.text
-
-    async def _download_pdf(self, client: httpx.AsyncClient, url: str, path: Path) -> None:
-        """Download a PDF from a given URL and check if it is not empty."""
-        response = await client.get(url, follow_redirects=True)
-        path.write_bytes(response.content)
-        if path.stat().st_size <= self.min_pdf_size:
-            path.unlink()
-            logger.debug(f"Downloaded PDF for {path.stem} is too small; deleting.")
-            return False
+        return response.content
+
+    async def _download_pdf(self, url: str, path: Path) -> bool:
+        """Download a PDF from a given URL in chunks and check if it is not empty."""
+        # Streamed to a temporary file, only renamed once complete so that an interrupted download is never reused
+        part_path = path.with_suffix(".part")
+        try:
+            async with self.client.stream("GET", url, follow_redirects=True) as response:
+                if response.status_code != 200:
+                    logger.debug(f"Failed to download PDF for {path.stem}: error {response.status_code}")
+                    return False
+                with open(part_path, 'wb') as f:
+                    async for chunk in response.aiter_bytes(chunk_size=65536):
+                        f.write(chunk)
+            if part_path.stat().st_size <= self.min_pdf_size:
+                logger.debug(f"Downloaded PDF for {path.stem} is too small; deleting.")
+                return False
+            part_path.rename(path)
+        finally:
+            part_path.unlink(missing_ok=True)
         logger.debug(f"Successfully downloaded PDF for {path.stem}")
         return True
 
     @staticmethod
-    def _load_existing_tei(path: Path) -> Article | None:
-        """Load an existing TEI file and parse it into an Article object."""
-        logger.debug(f"Found TEI file for {path.stem} in tmp folder")
-        with open(path, 'rb') as f:
-            article = Article.parse(TEIXMLParser(f.read()))
-        return article if article.abstract else None
-
-    @staticmethod
-    def _save_tei(path: Path, content: str) -> None:
+    def _save_tei(path: Path, content: bytes) -> None:
         """Save TEI content to a file."""
-        with open(path, 'w') as f:
-            f.write(content)
+        path.write_bytes(content)
+
+    @classmethod
+    def _save_and_parse_tei(cls, path: Path, content: bytes) -> Article | None:
+        """Save TEI content to a file and parse it into an Article object, caching the parse."""
+        cls._save_tei(path, content)
+        article = cls._parse_tei(content)
+        if article is not None:
+            dump_article(path, article)
+        return article
+
+    @classmethod
+    def _read_and_parse_tei(cls, path: Path) -> Article | None:
+        """Read a TEI file and parse it into an Article object, reusing the cached parse if up to date."""
+        article = load_article(path)
+        if article is None:
+            article = cls._parse_tei(path.read_bytes())
+            if article is not None:
+                dump_article(path, article)
+        return article
 
     @staticmethod
-    def _parse_tei(path: Path) -> Article | None:
-        """Parse a TEI file into an Article object."""
-        with open(path, 'rb') as f:
-            article = Article.parse(TEIXMLParser(f.read()))
-        return article if article.abstract else None
\ No newline at end of file
+    def _parse_tei(content: bytes) -> Article | None:
+        """Parse TEI content into an Article object."""
+        article = Article.parse(TEIXMLParser(content))
+        return article if article.abstract else None
@@ -1,14 +1,20 @@
 from pydantic import BaseModel, model_validator
+import io
+import sqlite3
+import time
+from contextlib import closing
 import httpx
 from pathlib import Path
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 import asyncio
 from httpx import ConnectTimeout, RemoteProtocolError, ReadTimeout, ConnectError, ReadError
-from tenacity import retry, stop_after_attempt, retry_if_exception_type, wait_random
+from tenacity import retry, stop_after_attempt, retry_if_exception_type, wait_exponential_jitter
 import xml.etree.ElementTree as ET
+from lxml import etree as LET
 from scholaretl.article_parser import JATSXMLParser, PubMedXMLParser
 from scholaretl.article import Article
-from bs4 import BeautifulSoup
+from .cache import load_article, dump_article
+from ..concurrency import DynamicGate
 import logging
 
 retry_on_error = (
@@ -18,7 +24,8 @@ retry_on_error = (
     httpx.ConnectError, 
     httpx.ReadError,
     ValueError,
-    ET.ParseError
+    ET.ParseError,
+    LET.XMLSyntaxError
 )
 
 def pubmed_down(retry_state):
@@ -29,6 +36,9 @@ def pubmed_down(retry_state):
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of IDs accepted by the PMC ID converter in one request
+IDCONV_BATCH_SIZE = 200
+
 class PubMedAPIWrapper(BaseModel):
     """
     A Wrapper around the PubMed API to conduct searches and fetch document summaries.
@@ -40,6 +50,8 @@ class PubMedAPIWrapper(BaseModel):
         additional_search_keywords: additional search keywords
         tmp_pmc_folder: Path to the temporary folder for storing PMC documents (default: "tmp/pmc")
         tmp_abstract_folder: Path to the temporary folder for storing abstracts (default: "tmp/abstract")
+        idconv_cache_days: Number of days the PubMed to PMC ID conversions are cached in tmp_pmc_folder (default: 30)
+        client: HTTP client shared by all PubMed and PMC requests
     """
 
     api_key: str = ""
@@ -48,62 +60,175 @@ class PubMedAPIWrapper(BaseModel):
     additional_search_keywords: str = ""
     tmp_pmc_folder: Path = Path("tmp/pmc")
     tmp_abstract_folder: Path = Path("tmp/abstract")
+    idconv_cache_days: float = 30
 
-    _pmc_semaphore: asyncio.Semaphore = asyncio.Semaphore(100)
-    _pubmed_semaphore: asyncio.Semaphore = asyncio.Semaphore(10)
+    # Concurrency limits lowered when NCBI rate limits the requests
+    _pmc_gate: DynamicGate = None
+    _pubmed_gate: DynamicGate = None
 
+    _client: httpx.AsyncClient = None
 
     @model_validator(mode="after")
     def val_model_after(self):
         self.tmp_pmc_folder.mkdir(parents=True, exist_ok=True)
         self.tmp_abstract_folder.mkdir(parents=True, exist_ok=True)
+        self._pmc_gate = DynamicGate(100)
+        self._pubmed_gate = DynamicGate(10)
         return self
 
-    @retry(
-        retry=retry_if_exception_type(retry_on_error),
-        stop=stop_after_attempt(5),
-        wait=wait_random(min=0.1, max=0.5),
-        retry_error_callback=lambda _: (_ for _ in ()).throw(httpx.ConnectError("Looks like PMC is down!"))
-    )
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client reused across requests so that concurrent fetches don't block the event loop, created on first use."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0, connect=60.0),
+                # Sized above the gates so that they, not the pool, rate limit NCBI requests
+                limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30.0),
+                http2=True,
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     async def convert_pubmed_to_pmc_id(self, pubmed_id: str) -> Optional[str]:
         """
-        Convert a PubMed ID to a PubMed Central (PMC) ID.
+        Convert a PubMed ID to a PubMed Central (PMC) ID, see convert_pubmed_to_pmc_ids.
 
         Parameters:
             pubmed_id: The PubMed ID to convert.
 
         Returns:
             The corresponding PMC ID, or None if not found.
+
+        Raises:
+            httpx.ConnectError: If the ID converter failed, rather than reporting the article as not in PMC.
+        """
+        pmc_ids, unresolved_ids = await self.convert_pubmed_to_pmc_ids([pubmed_id])
+        if unresolved_ids:
+            raise httpx.ConnectError(f"Could not convert PubMed ID {pubmed_id} to a PMC ID")
+        return pmc_ids.get(pubmed_id)
+
+    async def convert_pubmed_to_pmc_ids(self, pubmed_ids: List[str]) -> Tuple[Dict[str, str], List[str]]:
+        """
+        Convert PubMed IDs to PubMed Central (PMC) IDs, with one request per batch of IDCONV_BATCH_SIZE IDs.
+
+        Conversions (including the articles the converter reports as not in PMC) are cached on disk for
+        idconv_cache_days, only the PubMed IDs missing from the cache are sent to the ID converter.
+        PubMed IDs of failed batches are returned apart without being cached, to be converted again later.
+
+        Parameters:
+            pubmed_ids: The PubMed IDs to convert.
+
+        Returns:
+            The corresponding PMC IDs by PubMed ID, PubMed IDs without PMC ID are left out, and the PubMed IDs
+            that could not be converted.
+        """
+        pmc_ids = await asyncio.to_thread(self._load_pmc_ids, pubmed_ids)
+        missing_ids = [pubmed_id for pubmed_id in pubmed_ids if pubmed_id not in pmc_ids]
+
+        batches = [missing_ids[i:i + IDCONV_BATCH_SIZE] for i in range(0, len(missing_ids), IDCONV_BATCH_SIZE)]
+        new_pmc_ids, unresolved_ids = {}, []
+        results = await asyncio.gather(*[self._convert_pubmed_to_pmc_ids(batch) for batch in batches], return_exceptions=True)
+        for batch, batch_pmc_ids in zip(batches, results):
+            if isinstance(batch_pmc_ids, Exception):
+                logger.error(f"Error converting {len(batch)} PubMed IDs to PMC IDs: {batch_pmc_ids}")
+                unresolved_ids.extend(batch)
+            elif isinstance(batch_pmc_ids, BaseException):
+                raise batch_pmc_ids
+            else:
+                new_pmc_ids.update(batch_pmc_ids)
+        if new_pmc_ids:
+            await asyncio.to_thread(self._save_pmc_ids, new_pmc_ids)
+            pmc_ids.update(new_pmc_ids)
+
+        pmc_ids = {pubmed_id: pmc_id for pubmed_id, pmc_id in pmc_ids.items() if pmc_id is not None}
+        logger.debug(f"Successfully converted {len(pmc_ids)} of {len(pubmed_ids)} PubMed IDs to PMC IDs ({len(missing_ids)} requested)")
+        return pmc_ids, unresolved_ids
+
+    @property
+    def idconv_cache_path(self) -> Path:
+        """SQLite database caching the PubMed to PMC ID conversions."""
+        return self.tmp_pmc_folder / "idconv.sqlite"
+
+    def _connect_idconv_cache(self) -> sqlite3.Connection:
+        """Open the ID conversion cache, creating its table on first use."""
+        conn = sqlite3.connect(self.idconv_cache_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS idconv (pmid TEXT PRIMARY KEY, pmcid TEXT NULL, ts INTEGER NOT NULL)")
+        return conn
+
+    def _load_pmc_ids(self, pubmed_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Load the cached PMC IDs that have not expired, None for the articles not in PMC."""
+        min_timestamp = int(time.time() - self.idconv_cache_days * 86400)
+        pmc_ids = {}
+        with closing(self._connect_idconv_cache()) as conn:
+            # Batched to stay below SQLite's limit of query parameters
+            for i in range(0, len(pubmed_ids), IDCONV_BATCH_SIZE):
+                batch = pubmed_ids[i:i + IDCONV_BATCH_SIZE]
+                rows = conn.execute(
+                    f"SELECT pmid, pmcid FROM idconv WHERE ts >= ? AND pmid IN ({', '.join('?' * len(batch))})",
+                    (min_timestamp, *batch),
+                )
+                pmc_ids.update(rows)
+        return pmc_ids
+
+    def _save_pmc_ids(self, pmc_ids: Dict[str, Optional[str]]) -> None:
+        """Cache the PMC IDs returned by the ID converter, None for the articles not in PMC."""
+        timestamp = int(time.time())
+        with closing(self._connect_idconv_cache()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO idconv (pmid, pmcid, ts) VALUES (?, ?, ?)",
+                [(pubmed_id, pmc_id, timestamp) for pubmed_id, pmc_id in pmc_ids.items()],
+            )
+
+    @retry(
+        retry=retry_if_exception_type(retry_on_error),
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=0.1, max=30.0, jitter=0.5),
+        retry_error_callback=lambda _: (_ for _ in ()).throw(httpx.ConnectError("Looks like PMC is down!"))
+    )
+    async def _convert_pubmed_to_pmc_ids(self, pubmed_ids: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Convert a batch of PubMed IDs to PMC IDs with a single ID converter request.
+
+        Returns the PMC ID of each PubMed ID found in PMC and None for those reported as errors (not in PMC),
+        PubMed IDs missing from the response are left out.
         """
         params = {
             "tool": "my_tool",
             "email": self.email,
-            "ids": pubmed_id,
+            "ids": ",".join(pubmed_ids),
             "format": "json"
         }
 
-        response = httpx.get(
+        response = await self.client.get(
             url="https://www.ncbi.nlm.nih.gov/pmc/utils/idconv/v1.0/",
             params=params
         )
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ConnectTimeout(f"error {response.status_code}")
+        response.raise_for_status()
         json_data = response.json()
-        if response.status_code == 429:
-            raise ConnectTimeout("error 429")
-        try:
-            pmc_id = json_data["records"][0]["pmcid"]
-            logger.debug(f"Successfully converted PubMed ID {pubmed_id} to PMC ID")
-            return pmc_id
-        except (IndexError, KeyError):
-            #logger.debug(f"Failed to convert PubMed ID {pubmed_id} to PMC ID")
-            return None
-        except Exception as e:
-            logger.error(f"Error getting pmc id for {pubmed_id}: {e}")
-            return None
+        if json_data.get("status") != "ok":
+            raise ValueError(f"ID converter error: {json_data.get('message', json_data.get('status'))}")
+
+        pmc_ids = {}
+        for record in json_data.get("records", []):
+            pubmed_id = str(record.get("pmid", record.get("requested-id", "")))
+            if "pmcid" in record:
+                pmc_ids[pubmed_id] = record["pmcid"]
+            elif record.get("status") == "error":
+                # Explicitly reported as not found in PMC
+                pmc_ids[pubmed_id] = None
+        return {pubmed_id: pmc_id for pubmed_id, pmc_id in pmc_ids.items() if pubmed_id in pubmed_ids}
 
     @retry(
         retry=retry_if_exception_type(retry_on_error + (KeyError, )),
-        stop=stop_after_attempt(5),
-        wait=wait_random(min=0.1, max=0.5),
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=0.1, max=30.0, jitter=0.5),
         retry_error_callback=lambda _: (_ for _ in ()).throw(httpx.ConnectError("Looks like pubmed is down!"))
     )
     async def search_pubmed(self, query: str) -> List[str]:
@@ -128,15 +253,18 @@ class PubMedAPIWrapper(BaseModel):
             params["api_key"] = self.api_key
         
         logger.debug(f"Searching PubMed for papers matching '{query}'")
-        async with self._pubmed_semaphore:
-            response = httpx.get(
+        async with self._pubmed_gate:
+            response = await self.client.get(
                 url="https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi",
                 params=params,
-                timeout=httpx.Timeout(10.0, connect=60.0)
             )
 
+            if response.status_code == 429:
+                await self._pubmed_gate.throttled()
+                raise ConnectTimeout("error 429")
             response.raise_for_status()
             json_data = response.json()
+        await self._pubmed_gate.succeeded()
         pubmed_ids = json_data["esearchresult"]["idlist"]
         logger.info(f"Successfully found {len(pubmed_ids)} papers for '{query}'")
         return pubmed_ids
@@ -144,8 +272,8 @@ class PubMedAPIWrapper(BaseModel):
         
     @retry(
         retry=retry_if_exception_type(retry_on_error+(IndexError,)),
-        stop=stop_after_attempt(5),
-        wait=wait_random(min=0.1, max=0.5),
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=0.1, max=30.0, jitter=0.5),
         retry_error_callback=lambda _: (_ for _ in ()).throw(httpx.ConnectError("Looks like Pubmed is down!"))
     )
     async def get_pubmed_abstract(self, pubmed_id: str) -> Optional[Article]:
@@ -163,9 +291,9 @@ class PubMedAPIWrapper(BaseModel):
         # Load the abstract from the temporary folder if it exists
         if saving_path.exists():
             logger.debug(f"Found abstract file for {pubmed_id} in tmp folder")
-            with open(saving_path, 'rb') as f:
-                article = Article.parse(PubMedXMLParser(f.read()))
-            if article.abstract:
+            # Disk reads and XML parsing run in a thread to keep the event loop responsive
+            article = await asyncio.to_thread(self._read_and_parse_abstract, saving_path)
+            if article is not None:
                 return article
 
         params = {
@@ -176,57 +304,59 @@ class PubMedAPIWrapper(BaseModel):
         if self.api_key:
             params["api_key"] = self.api_key
         
-        async with self._pubmed_semaphore:
-            response = httpx.get(
+        async with self._pubmed_gate:
+            response = await self.client.get(
                 url="https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi",
                 params=params,
-                timeout=httpx.Timeout(10.0, connect=60.0)
             )
             
         if response.status_code == 429:
+            await self._pubmed_gate.throttled()
             raise httpx.ConnectTimeout("error 429")
-        xml = ET.fromstring(response.content)
-        # For compatibility with JATS ETL parsing
-        xml = ET.ElementTree(xml.findall('PubmedArticle')[0])
-        xml.write(saving_path)
+        await self._pubmed_gate.succeeded()
+        # For compatibility with JATS ETL parsing, only the first PubmedArticle is kept
+        # so parsing stops as soon as it is complete
+        xml_articles = LET.iterparse(io.BytesIO(response.content), events=("end",), tag="PubmedArticle")
+        _, xml = next(xml_articles, (None, None))
+        if xml is None:
+            raise IndexError(f"No PubmedArticle in the response for {pubmed_id}")
+        # Serialized once, for both the temporary folder and the parser
+        content = LET.tostring(xml, encoding="utf-8")
         logger.info(f"Successfully downloaded abstract of {pubmed_id}")
         
-        # Load the abstract from the temporary folder
-        if saving_path.exists():
-            logger.debug(f"Abstract loaded for {pubmed_id} in tmp folder")
-            with open(saving_path, 'rb') as f:
-                article = Article.parse(PubMedXMLParser(f.read()))
-            if article.abstract:
-                return article
-        return None
+        return await asyncio.to_thread(self._save_and_parse_abstract, saving_path, content)
     
+    def pubmed_central_path(self, pubmed_id: str) -> Path:
+        """Path of the full-text article of the given PubMed ID in the temporary folder, existing once fetched."""
+        return self.tmp_pmc_folder / f"{pubmed_id}.xml"
+
     @retry(
         retry=retry_if_exception_type(retry_on_error),
-        stop=stop_after_attempt(5),
-        wait=wait_random(min=0.1, max=0.5),
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=0.1, max=30.0, jitter=0.5),
         retry_error_callback=lambda _: (_ for _ in ()).throw(httpx.ConnectError("Looks like PMC is down!"))
     )
-    async def get_pubmed_central(self, pubmed_id: str) -> Optional[Article]:
+    async def get_pubmed_central(self, pubmed_id: str, pmc_id: Optional[str]) -> Optional[Article]:
         """
         Fetch the full-text article from PubMed Central for the given PubMed ID and return it as an Article object.
 
         Parameters:
             pubmed_id: The PubMed ID to fetch the full-text article for.
+            pmc_id: The corresponding PMC ID (see convert_pubmed_to_pmc_ids), None if the article is not in PMC.
 
         Returns:
             The Article object containing the full-text article, or None if not found.
         """
-        saving_path = self.tmp_pmc_folder / f"{pubmed_id}.xml"
+        saving_path = self.pubmed_central_path(pubmed_id)
 
         # Load the article from the temporary folder if it exists
         if saving_path.exists():
             logger.debug(f"Found PMC file for {pubmed_id} in tmp folder")
-            with open(saving_path, 'r') as f:
-                article = Article.parse(JATSXMLParser.from_string(f))
-            if article.abstract and article.section_paragraphs:
+            # Disk reads and XML parsing run in a thread to keep the event loop responsive
+            article = await asyncio.to_thread(self._read_and_parse_pmc, saving_path)
+            if article is not None:
                 return article
 
-        pmc_id = await self.convert_pubmed_to_pmc_id(pubmed_id)
         if pmc_id is None:
             return None
         
@@ -236,39 +366,86 @@ class PubMedAPIWrapper(BaseModel):
             "metadataPrefix": "oai_dc"
         }
 
-        async with self._pmc_semaphore:
-            response =  httpx.get(
+        async with self._pmc_gate:
+            response = await self.client.get(
                 url='https://www.ncbi.nlm.nih.gov/pmc/oai/oai.cgi',
                 params=params,
-                timeout=httpx.Timeout(10.0, connect=60.0)
             )
     
         if response.status_code == 429:
+            await self._pmc_gate.throttled()
             raise ConnectTimeout("error 429")
+        await self._pmc_gate.succeeded()
         try:
-            # Save the full-text article to the temporary folder
-            xml_paper = BeautifulSoup(response.content, "xml")
-            # For compatibility with JATS ETL parsing
-            xml_paper = xml_paper.find_all('article')[0]
-            if len(xml_paper.find_all('body')[0].find_all('sec')) < 2:
+            xml_paper = LET.fromstring(response.content).find(".//{*}article")
+            if xml_paper is None:
+                raise IndexError(f"No article in the PMC response for {pubmed_id}")
+            # For compatibility with JATS ETL parsing: detach the article from the OAI envelope
+            # (so it doesn't inherit the envelope namespace declarations) and strip the JATS default namespace
+            xml_paper.getparent().remove(xml_paper)
+            namespace = LET.QName(xml_paper).namespace
+            if namespace:
+                for element in xml_paper.iter(f"{{{namespace}}}*"):
+                    element.tag = LET.QName(element).localname
+            body = xml_paper.find("body")
+            if body is None or len(body.findall(".//sec")) < 2:
                 return None
-            # ETL parsing is expecting only these 2 attributes
-            xml_paper.attrs = {key: value for key, value in xml_paper.attrs.items() if key in ["xmlns:xlink", "article-type", "xmlns:ali", "xmlns:mml"]}
-            with open(saving_path, 'w') as f:
-                f.write(xml_paper.prettify().replace('\n', ''))
+            # ETL parsing is expecting only the article-type attribute (and the used namespace declarations)
+            for key in list(xml_paper.attrib):
+                if key != "article-type":
+                    del xml_paper.attrib[key]
+            LET.cleanup_namespaces(xml_paper)
+            # Serialized once, for both the temporary folder and the parser
+            content = LET.tostring(xml_paper, encoding="utf-8")
             logger.info(f"Successfully found PMC full-text for {pubmed_id}")
-        except (IndexError, ET.ParseError):
+        except (IndexError, LET.XMLSyntaxError):
             logger.debug(f"Failed to parse full-text for {pubmed_id}")
             return None
         except Exception as e:
             logger.error(f"Error getting PMC full-text for {pubmed_id}: {e}")
             return None
 
-        # Load the article from the temporary folder
-        if saving_path.exists():
-            logger.debug(f"PMC loaded for {pubmed_id} in tmp folder")
-            with open(saving_path, 'r') as f:
-                article = Article.parse(JATSXMLParser.from_string(f))
-            if article.abstract and article.section_paragraphs:
-                return article
-        return None
\ No newline at end of file
+        return await asyncio.to_thread(self._save_and_parse_pmc, saving_path, content)
+
+    @classmethod
+    def _read_and_parse_abstract(cls, path: Path) -> Optional[Article]:
+        """Read a PubMed XML file and parse it into an Article object, reusing the cached parse if up to date."""
+        article = load_article(path)
+        if article is None:
+            return cls._parse_abstract(path, path.read_bytes())
+        return article if article.abstract else None
+
+    @classmethod
+    def _save_and_parse_abstract(cls, path: Path, content: bytes) -> Optional[Article]:
+        """Save PubMed XML content to a file and parse it into an Article object."""
+        path.write_bytes(content)
+        return cls._parse_abstract(path, content)
+
+    @staticmethod
+    def _parse_abstract(path: Path, content: bytes) -> Optional[Article]:
+        """Parse the PubMed XML content saved at path into an Article object, caching the parse next to it."""
+        article = Article.parse(PubMedXMLParser(content))
+        dump_article(path, article)
+        return article if article.abstract else None
+
+    @classmethod
+    def _read_and_parse_pmc(cls, path: Path) -> Optional[Article]:
+        """Read a PMC JATS XML file and parse it into an Article object, reusing the cached parse if up to date."""
+        article = load_article(path)
+        if article is None:
+            return cls._parse_pmc(path, path.read_bytes())
+        return article if article.abstract and article.section_paragraphs else None
+
+    @classmethod
+    def _save_and_parse_pmc(cls, path: Path, content: bytes) -> Optional[Article]:
+        """Save PMC JATS XML content to a file and parse it into an Article object."""
+        path.write_bytes(content)
+        return cls._parse_pmc(path, content)
+
+    @staticmethod
+    def _parse_pmc(path: Path, content: bytes) -> Optional[Article]:
+        """Parse the PMC JATS XML content saved at path into an Article object, caching the parse next to it."""
+        # Parsers hold a single article, but they read bytes directly (from_string needs decoded text)
+        article = Article.parse(JATSXMLParser(io.BytesIO(content)))
+        dump_article(path, article)
+        return article if article.abstract and article.section_paragraphs else None
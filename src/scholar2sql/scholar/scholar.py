@@ -3,15 +3,63 @@ from .pubmed import PubMedAPIWrapper
 from .grobid import GrobidAPIWrapper
 from ..metadata import Metadata
 import asyncio
-from typing import AsyncIterator, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from collections import Counter
+from functools import lru_cache
 import logging
+import threading
 from scholaretl.article import Article
-from bm25s import tokenize, BM25, debug_logger
+from bm25s import tokenize, debug_logger
+import numpy as np
 import Stemmer
 
 debug_logger.setLevel(logging.ERROR) #bm25s not very well written there, level is hardcoded to debug
 logger = logging.getLogger(__name__)
 
+# Stemmers are not thread-safe and the top sections are ranked in worker threads
+_thread_local = threading.local()
+
+# Default PMC ID of retrieve_one_article, telling it to look up the PMC ID itself
+_UNRESOLVED = object()
+
+def _get_stemmer() -> Stemmer.Stemmer:
+    """Get the english stemmer of the current thread, created on first use."""
+    if not hasattr(_thread_local, "stemmer"):
+        _thread_local.stemmer = Stemmer.Stemmer("english")
+    return _thread_local.stemmer
+
+@lru_cache(maxsize=None)
+def _tokenize_question(research_question: str) -> Tuple[str, ...]:
+    """Tokenize a research question once, as it is ranked against every article of its query."""
+    return tuple(tokenize(research_question, stemmer=_get_stemmer(), return_ids=False, show_progress=False)[0])
+
+def _tokenize_docs(docs: List[str]) -> Tuple[Tuple[str, ...], ...]:
+    """Tokenize the sections of an article in one call."""
+    return tuple(map(tuple, tokenize(texts=docs, stopwords="en", stemmer=_get_stemmer(), return_ids=False, show_progress=False)))
+
+def _bm25_scores(docs_tokens: Tuple[Tuple[str, ...], ...], query_tokens: Tuple[str, ...], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """
+    Scores documents against a query with BM25 (Lucene variant, as bm25s' default).
+
+    Only the query terms are counted, rather than indexing the whole vocabulary of the documents.
+
+    Args:
+        docs_tokens (Tuple[Tuple[str, ...], ...]): The tokens of each document.
+        query_tokens (Tuple[str, ...]): The tokens of the query.
+        k1 (float, optional): Term frequency saturation. Defaults to 1.5.
+        b (float, optional): Document length normalization. Defaults to 0.75.
+
+    Returns:
+        np.ndarray: The score of each document.
+    """
+    counts = [Counter(tokens) for tokens in docs_tokens]
+    term_frequencies = np.array([[count[token] for token in query_tokens] for count in counts], dtype=float).reshape(len(docs_tokens), len(query_tokens))
+    document_frequencies = np.count_nonzero(term_frequencies, axis=0)
+    idf = np.log(1 + (len(docs_tokens) - document_frequencies + 0.5) / (document_frequencies + 0.5))
+    doc_lengths = np.array([len(tokens) for tokens in docs_tokens], dtype=float)
+    length_norm = k1 * (1 - b + b * doc_lengths / (doc_lengths.mean() or 1.0))
+    return (term_frequencies / (term_frequencies + length_norm[:, None]) * idf).sum(axis=1)
+
 class Scholar(BaseModel):
     """
     A class that retrieves and processes scholarly articles from PubMed and GROBID.
@@ -21,36 +69,91 @@ class Scholar(BaseModel):
         grobid (GrobidAPIWrapper): An instance of the GrobidAPIWrapper class.
         top_sections_per_article (int): The maximum number of sections to retrieve for each article.
         email (str): The email address to be used for the PubMed and GROBID APIs.
+        _articles (Dict[str, asyncio.Future]): Articles retrieved or being retrieved, by PubMed ID.
     """
     pubmed: PubMedAPIWrapper
     grobid: GrobidAPIWrapper
     top_sections_per_article: int = 5
     email: str
 
+    _articles: Dict[str, "asyncio.Future[Tuple[Article, Metadata]]"] = {}
+    _docs_tokens: Dict[str, Tuple[Tuple[str, ...], ...]] = {}
+
     @model_validator(mode="after")
     def val_model_after(self):
         self.grobid.email = self.email
         self.pubmed.email = self.email
         return self
 
-    async def retrieve_one_article(self, pubmed_id: str) -> Tuple[Article, Metadata]:
+    async def aclose(self) -> None:
+        """Cancel the article retrievals still running and close the HTTP clients of the underlying APIs."""
+        pending = [future for future in self._articles.values() if not future.done()]
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        # Only the retrieved articles are kept, a later run starts the cancelled and failed ones again
+        self._articles = {
+            pubmed_id: future for pubmed_id, future in self._articles.items()
+            if not future.cancelled() and future.exception() is None
+        }
+        self._docs_tokens = {pubmed_id: tokens for pubmed_id, tokens in self._docs_tokens.items() if pubmed_id in self._articles}
+        await self.pubmed.aclose()
+        await self.grobid.aclose()
+
+    async def retrieve_one_article(self, pubmed_id: str, pmc_id: Optional[str] = _UNRESOLVED) -> Tuple[Article, Metadata]:
         """
-        Retrieves a single article from PubMed and GROBID based on the provided PubMed ID.
+        Retrieves a single article based on the provided PubMed ID, only fetching it once
+        when several queries return the same article, even while it is still being fetched.
 
         Args:
             pubmed_id (str): The PubMed ID of the article to retrieve.
+            pmc_id (str, optional): The PMC ID of the article, None if it is not in PMC. Looked up when not given.
 
         Returns:
             Tuple[Article, Metadata]: A tuple containing the retrieved article and its metadata.
         """
-        metadata = Metadata().update_from_dict({"pubmed_id": pubmed_id})
-
-        article = await self.pubmed.get_pubmed_central(pubmed_id)
+        future = self._articles.get(pubmed_id)
+        if future is None:
+            future = self._articles[pubmed_id] = asyncio.ensure_future(self._retrieve_one_article(pubmed_id, pmc_id))
+        try:
+            # Shielded so that a cancelled caller doesn't cancel the fetch for the others awaiting it
+            article, metadata = await asyncio.shield(future)
+        except BaseException:
+            # Failed or cancelled fetches are not cached, a later query retries the article.
+            # When only this caller is cancelled, the fetch goes on for the others awaiting it.
+            if self._articles.get(pubmed_id) is future and future.done() and (future.cancelled() or future.exception() is not None):
+                del self._articles[pubmed_id]
+                self._docs_tokens.pop(pubmed_id, None)
+            raise
+        # Each (question, article) pair fills its own sections in the metadata
+        return article, metadata.model_copy(deep=True) if metadata is not None else None
+
+    async def _retrieve_one_article(self, pubmed_id: str, pmc_id: Optional[str]) -> Tuple[Article, Metadata]:
+        """Retrieves a single article from PubMed and GROBID based on the provided PubMed ID."""
+        if pmc_id is _UNRESOLVED:
+            pmc_id = await self.pubmed.convert_pubmed_to_pmc_id(pubmed_id)
+        # The defaults are already valid, skip validating them for every article
+        metadata = Metadata.model_construct().update_from_dict({"pubmed_id": pubmed_id})
+
+        # When the full text has to be downloaded from PMC, the abstract is fetched meanwhile in case
+        # the full text turns out to be unusable. Otherwise it is only looked up in the tmp folder.
+        fetch_pubmed_central = pmc_id is not None and not self.pubmed.pubmed_central_path(pubmed_id).exists()
+        abstract_task = asyncio.ensure_future(self.pubmed.get_pubmed_abstract(pubmed_id)) if fetch_pubmed_central else None
+        try:
+            article = await self.pubmed.get_pubmed_central(pubmed_id, pmc_id)
+        except BaseException:
+            if abstract_task is not None:
+                abstract_task.cancel()
+                await asyncio.gather(abstract_task, return_exceptions=True)
+            raise
         if article is not None:
+            if abstract_task is not None:
+                abstract_task.cancel()
+                await asyncio.gather(abstract_task, return_exceptions=True)
             metadata.format.value = "PMC"
             return article, metadata
 
-        article = await self.pubmed.get_pubmed_abstract(pubmed_id)
+        article = await (abstract_task or self.pubmed.get_pubmed_abstract(pubmed_id))
         if article is None:
             return None, None
 
@@ -74,21 +177,32 @@ class Scholar(BaseModel):
         Returns:
             dict: A dictionary mapping section numbers to the corresponding section text.
         """
-        docs = article.abstract + [section[1] for section in article.section_paragraphs]
+        top_k = self.top_sections_per_article
+        docs = list(article.abstract)
+        docs.extend(paragraph for _, paragraph in article.section_paragraphs)
 
-        if len(docs) <= self.top_sections_per_article:
+        if len(docs) <= top_k:
             return {f"section_{i+1}": paragraph for i, paragraph in enumerate(docs)}
 
-        stemmer = Stemmer.Stemmer("english")
-        docs_tokens = tokenize(texts=docs, stopwords="en", stemmer=stemmer, show_progress=False)
-        retriever = BM25()
-        retriever.index(corpus=docs_tokens, show_progress=False)
+        scores = _bm25_scores(self._get_docs_tokens(article.pubmed_id, docs), _tokenize_question(research_question))
+        top_docs = np.argsort(-scores, kind="stable")[:top_k]
+
+        logger.debug(f"Get top_k docs for {article.pubmed_id} with scores {scores[top_docs]}")
+        return {f"section_{i+1}": docs[doc] for i, doc in enumerate(top_docs)}
 
-        question_tokens = tokenize(research_question, stemmer=stemmer)
-        results, scores = retriever.retrieve(query_tokens=question_tokens, corpus=docs, k=self.top_sections_per_article, show_progress=False)
+    def _get_docs_tokens(self, pubmed_id: Optional[str], docs: List[str]) -> Tuple[Tuple[str, ...], ...]:
+        """
+        Tokenize the sections of an article once for all the research questions and queries it is ranked against.
 
-        logger.debug(f"Get top_k docs for {article.pubmed_id} with scores {scores[0]}")
-        return {f"section_{i+1}": paragraph for i, paragraph in enumerate(results[0])}
+        The tokens are kept as long as the retrieved article in _articles, articles without PubMed ID are not cached.
+        """
+        if pubmed_id is None:
+            return _tokenize_docs(docs)
+        docs_tokens = self._docs_tokens.get(pubmed_id)
+        if docs_tokens is None:
+            # Ranked in worker threads, an article tokenized twice at the same time only costs the duplicate work
+            docs_tokens = self._docs_tokens[pubmed_id] = _tokenize_docs(docs)
+        return docs_tokens
 
     async def iter(self, pubmed_query: str) -> AsyncIterator[Tuple[Article, Metadata]]:
         """
@@ -100,11 +214,22 @@ class Scholar(BaseModel):
         Yields:
             Tuple[Article, Metadata]: A tuple containing the retrieved article and its metadata.
         """
+        pubmed_ids = await self.pubmed.search_pubmed(pubmed_query)
+        # PMC IDs are resolved in batch, only for the articles not retrieved yet. The others, and those of
+        # failed batches, are left unresolved to be looked up by each retrieval when it has to be started.
+        new_ids = {pubmed_id for pubmed_id in pubmed_ids if pubmed_id not in self._articles}
+        pmc_ids, unresolved_ids = await self.pubmed.convert_pubmed_to_pmc_ids([pubmed_id for pubmed_id in pubmed_ids if pubmed_id in new_ids])
+        new_ids.difference_update(unresolved_ids)
         tasks = [
-            asyncio.ensure_future(self.retrieve_one_article(pubmed_id))
-            for pubmed_id in await self.pubmed.search_pubmed(pubmed_query)
+            asyncio.ensure_future(self.retrieve_one_article(pubmed_id, pmc_ids.get(pubmed_id) if pubmed_id in new_ids else _UNRESOLVED))
+            for pubmed_id in pubmed_ids
         ]
-        for task in asyncio.as_completed(tasks):
-            article, metadata = await task
-            if article is not None and (article.abstract or article.section_paragraphs):
-                yield article, metadata
+        try:
+            for task in asyncio.as_completed(tasks):
+                article, metadata = await task
+                if article is not None and (article.abstract or article.section_paragraphs):
+                    yield article, metadata
+        finally:
+            # The iteration was interrupted (e.g. the run was cancelled), stop retrieving the remaining articles
+            for task in tasks:
+                task.cancel()
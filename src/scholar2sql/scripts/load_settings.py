@@ -1,11 +1,12 @@
 import os
 from pathlib import Path
 import argparse
-from ..config import Configs
 from rich import print
 
 def main():
     args = parse_args()
+    # Imported after parsing so that --help does not load the whole application
+    from ..config import Configs
     config_path = args.config_path
     print(Configs.from_yaml(config_path))
 
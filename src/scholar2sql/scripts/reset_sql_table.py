@@ -2,10 +2,11 @@ import os
 from pathlib import Path
 import argparse
 import asyncio
-from ..config import Configs
 
 def main():
     args = parse_args()
+    # Imported after parsing so that --help does not load the whole application
+    from ..config import Configs
     config_path = args.config_path
     configs = Configs.from_yaml(config_path)
     asyncio.run(configs.sql_database.drop_table())
@@ -1,7 +1,6 @@
 import os
 from pathlib import Path
 import argparse
-from ..config import Configs
 import asyncio
 import logging
 
@@ -9,6 +8,8 @@ logger = logging.getLogger(__name__)
 
 def main():
     args = parse_args()
+    # Imported after parsing so that --help does not load the whole application
+    from ..config import Configs
     config_path = args.config_path
     configs = Configs.from_yaml(config_path)
     asyncio.run(configs.run())
@@ -1,12 +1,15 @@
-from pydantic import BaseModel, SecretStr, ConfigDict
+from pydantic import BaseModel, SecretStr, ConfigDict, model_validator
 import os
 import json
 import asyncio
+from contextlib import asynccontextmanager
 from mysql.connector.aio import connect
 import logging
 from .schema import SchemaInputParameter, SchemaOutputFeature, SchemaItem, EnumSchemaDoc
 from .metadata import Metadata
+from .concurrency import DynamicGate
 from functools import cached_property
+from typing import Any, AsyncIterator
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,7 @@ class SqlAPIWrapper(BaseModel):
         password (SecretStr): Database password.
         database (str): Database name.
         table (str): Table name for operations.
+        pool_size (int): Maximum number of idle connections kept open for reuse.
         metadata (Metadata): Metadata for the table.
     """
 
@@ -31,14 +35,24 @@ class SqlAPIWrapper(BaseModel):
     password: SecretStr = None
     database: str = None
     table: str
+    pool_size: int = 5
 
     metadata: Metadata = Metadata()
     _input_parameters: list[SchemaInputParameter] = []
     _output_features: list[SchemaOutputFeature] = []
 
-    _semaphore: asyncio.Semaphore = asyncio.Semaphore(5)
+    _semaphore: DynamicGate = None
 
-    def get_connection(self):
+    _pool: asyncio.Queue = None
+
+    @model_validator(mode="after")
+    def val_model_after(self):
+        self._pool = asyncio.Queue(maxsize=self.pool_size)
+        # One connection per concurrent operation, the limit can be lowered with set_limit when MySQL is the bottleneck
+        self._semaphore = DynamicGate(self.pool_size)
+        return self
+
+    def get_connection(self, **kwargs):
         """
         Establishes and returns a database connection.
 
@@ -49,8 +63,40 @@ class SqlAPIWrapper(BaseModel):
             host=self.host,
             user=self.username,
             password=self.password.get_secret_value(),
-            database=self.database
+            database=self.database,
+            **kwargs
         )
+
+    @asynccontextmanager
+    async def pooled_connection(self) -> AsyncIterator:
+        """
+        Borrows an idle connection from the pool, opening a new one if none is idle.
+
+        Pooled connections are in autocommit mode so that reads always see the latest records,
+        writes spanning several statements start their own transaction.
+
+        Yields:
+            mysql.connector.aio.Connection: Asynchronous database connection.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except asyncio.QueueEmpty:
+            conn = await self.get_connection(autocommit=True)
+        try:
+            yield conn
+        except BaseException:
+            # The connection may be broken or in the middle of a transaction
+            await conn.shutdown()
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except asyncio.QueueFull:
+            await conn.close()
+
+    async def close(self):
+        """Closes the idle pooled connections."""
+        while not self._pool.empty():
+            await self._pool.get_nowait().close()
     
     async def create_table(self):
         """Creates the table if it doesn't exist."""
@@ -107,35 +153,42 @@ class SqlAPIWrapper(BaseModel):
         Returns:
             int or None: Record ID if found, None otherwise.
         """
-        conditions = ' AND '.join(
-            [f"{col}='{val.name}'" for col, val in zip(self.input_columns, inputs_values)]
-        ) + f" AND pubmed_id='{pubmed_id}'"
+        # Values are passed as parameters, so that they are escaped and the query text is the same for every record
+        conditions = ' AND '.join([f"{col} = %s" for col in self.input_columns] + ["pubmed_id = %s"])
+        params = tuple(val.name for val in inputs_values) + (pubmed_id,)
 
         query = f"SELECT id FROM {self.table} WHERE {conditions};"
         
-        async with self._semaphore, await self.get_connection() as conn:
+        async with self._semaphore, self.pooled_connection() as conn:
             async with await conn.cursor() as cursor:
-                await cursor.execute(query)
+                await cursor.execute(query, params)
                 result = await cursor.fetchone()
             
         return result[0] if result else None
 
-    async def upsert_record(self, record_id: int, inputs_values: list[SchemaItem], metadata: Metadata, outputs):
+    @cached_property
+    def insert_query(self) -> str:
+        """Returns the query inserting a record, with a named parameter per column."""
+        return f"INSERT INTO {self.table} ({', '.join(self.all_columns)}) VALUES ({', '.join([f'%({col})s' for col in self.all_columns])});"
+
+    @cached_property
+    def update_query(self) -> str:
+        """Returns the query updating the record with the id parameter, with a named parameter per column."""
+        return f"UPDATE {self.table} SET {', '.join([f'{col} = %({col})s' for col in self.all_columns])} WHERE id = %(id)s;"
+
+    def _record_data(self, inputs_values: list[SchemaItem], metadata: Metadata, outputs) -> dict:
         """
-        Inserts a new record or updates an existing one.
+        Builds the query parameters of a record.
 
         Args:
-            record_id (int): ID of the existing record (None for new records).
             inputs_values (list[SchemaItem]): List of input values.
             metadata (Metadata): Record metadata.
             outputs: Output data.
-        """
-        if record_id is None:
-            query = f"INSERT INTO {self.table} ({', '.join(self.all_columns)}) VALUES ({', '.join([f'%({col})s' for col in self.all_columns])});"
-        else:
-            query = f"UPDATE {self.table} SET {', '.join([f'{col} = %({col})s' for col in self.all_columns])} WHERE id = {record_id};"
 
-        data = {
+        Returns:
+            dict: Value of each column.
+        """
+        return {
             **{
                 key: json.dumps(value['value']) if isinstance(value['value'], (list, dict)) else value['value'] 
                 for key, value in metadata.model_dump(include=self.metadata.to_save).items()
@@ -149,14 +202,73 @@ class SqlAPIWrapper(BaseModel):
             }
         }
 
+    async def upsert_record(self, record_id: int, inputs_values: list[SchemaItem], metadata: Metadata, outputs) -> bool:
+        """
+        Inserts a new record or updates an existing one.
+
+        Args:
+            record_id (int): ID of the existing record (None for new records).
+            inputs_values (list[SchemaItem]): List of input values.
+            metadata (Metadata): Record metadata.
+            outputs: Output data.
+
+        Returns:
+            bool: True if the record was written, False otherwise.
+        """
         try:
-            async with self._semaphore, await self.get_connection() as conn:
-                async with await conn.cursor() as cursor:
-                    await cursor.execute(query, data)
-                await conn.commit()
-            
-            logger.debug(
-                f"Successfully {'inserted' if record_id is None else 'updated'} record {cursor.lastrowid if record_id is None else record_id} with PubMed ID {metadata.pubmed_id.value}"
-            )
+            await self._upsert_batch([(record_id, inputs_values, metadata, outputs)])
+            return True
         except Exception as e:
-            logger.error(f"Error upserting record: {e}")
\ No newline at end of file
+            logger.error(f"Error upserting record with PubMed ID {metadata.pubmed_id.value}: {e}")
+            return False
+
+    async def upsert_many(self, records: list[tuple[int | None, list[SchemaItem], Metadata, Any]]) -> int:
+        """
+        Inserts new records and updates existing ones over a single connection and transaction.
+
+        If the transaction fails, the records are written one by one so that a faulty record only loses itself.
+
+        Args:
+            records (list[tuple]): The (record_id, inputs_values, metadata, outputs) of each record, record_id being None for new records.
+
+        Returns:
+            int: The number of records written.
+        """
+        if len(records) > 1:
+            try:
+                await self._upsert_batch(records)
+                return len(records)
+            except Exception as e:
+                logger.warning(f"Error upserting {len(records)} records at once, upserting them one by one: {e}")
+        written_count = 0
+        for record in records:
+            written_count += await self.upsert_record(*record)
+        return written_count
+
+    async def _upsert_batch(self, records: list[tuple[int | None, list[SchemaItem], Metadata, Any]]) -> None:
+        """
+        Writes records in a single transaction, new records with one batched insert, existing records one update after the other.
+
+        Raises:
+            Exception: Any database error, in which case none of the records are written.
+        """
+        inserts, updates = [], []
+        for record_id, inputs_values, metadata, outputs in records:
+            data = self._record_data(inputs_values=inputs_values, metadata=metadata, outputs=outputs)
+            if record_id is None:
+                inserts.append(data)
+            else:
+                updates.append({**data, "id": record_id})
+
+        async with self._semaphore, self.pooled_connection() as conn:
+            await conn.start_transaction()
+            async with await conn.cursor() as cursor:
+                if inserts:
+                    await cursor.executemany(self.insert_query, inserts)
+                for data in updates:
+                    await cursor.execute(self.update_query, data)
+            await conn.commit()
+
+        logger.debug(
+            f"Successfully inserted {len(inserts)} and updated {len(updates)} records with PubMed IDs {[metadata.pubmed_id.value for _, _, metadata, _ in records]}"
+        )